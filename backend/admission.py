@@ -0,0 +1,231 @@
+"""
+admission.py — Admission control in front of the AI pipeline.
+
+Every POST /report-incident passes three token buckets (per client IP, per
+reporter type, global) and then a concurrency gate on in-flight analyses.
+Part of the global capacity is held in reserve for high-severity reports, so
+a flood of minor reports can't lock out a severity-5 one.
+When the gate is saturated, waiting reports are queued by severity so a
+severity-5 report is always admitted ahead of a severity-1 report; if the
+queue is full, the lowest-severity waiter is shed. Rejections are 429 (rate
+limited) or 503 (saturated) with a Retry-After header.
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import ipaddress
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, Request
+from dotenv import load_dotenv
+
+from constants import REPORTER_TYPES
+
+load_dotenv()
+
+IP_RATE_PER_MIN = float(os.getenv("ADMISSION_IP_RATE_PER_MIN", "10"))
+IP_BURST = float(os.getenv("ADMISSION_IP_BURST", "20"))
+REPORTER_RATE_PER_MIN = float(os.getenv("ADMISSION_REPORTER_RATE_PER_MIN", "120"))
+REPORTER_BURST = float(os.getenv("ADMISSION_REPORTER_BURST", "60"))
+GLOBAL_RATE_PER_MIN = float(os.getenv("ADMISSION_GLOBAL_RATE_PER_MIN", "300"))
+GLOBAL_BURST = float(os.getenv("ADMISSION_GLOBAL_BURST", "100"))
+# Drawn on only by severity >= HIGH_SEVERITY once the global bucket is empty
+GLOBAL_RESERVE_RATE_PER_MIN = float(os.getenv("ADMISSION_GLOBAL_RESERVE_RATE_PER_MIN", "60"))
+GLOBAL_RESERVE_BURST = float(os.getenv("ADMISSION_GLOBAL_RESERVE_BURST", "20"))
+HIGH_SEVERITY = 4
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "8"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "15"))
+# Comma-separated IPs/CIDRs of reverse proxies allowed to set X-Forwarded-For
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(p.strip(), strict=False)
+    for p in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if p.strip()
+]
+
+MAX_TRACKED_IPS = 10000
+# Shared bucket for reporter_type values outside REPORTER_TYPES
+OTHER_REPORTER = "Autre"
+
+
+class TokenBucket:
+    def __init__(self, rate_per_min: float, burst: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until one token is available (0 if available now)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class Saturated(Exception):
+    pass
+
+
+class PriorityGate:
+    """Concurrency limit whose waiters are served highest severity first, then FIFO."""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    async def acquire(self, severity: int, timeout: float):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters)
+            if -worst[0] >= severity:
+                raise Saturated()
+            # Shed the lowest-severity (latest) waiter to make room
+            self._waiters.remove(worst)
+            heapq.heapify(self._waiters)
+            worst[2].set_exception(Saturated())
+            _counters["shed"] += 1
+        entry = (-severity, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(entry[2], timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            elif entry[2].done() and not entry[2].cancelled() and entry[2].exception() is None:
+                # Slot was handed over just as we gave up: pass it on
+                self.release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise Saturated()
+
+    def release(self):
+        # Hand the slot straight to the next live waiter, keeping in_flight unchanged
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def queued_by_severity(self) -> dict:
+        counts = {}
+        for neg_sev, _, fut in self._waiters:
+            if not fut.done():
+                counts[-neg_sev] = counts.get(-neg_sev, 0) + 1
+        return counts
+
+
+_ip_buckets = OrderedDict()
+_reporter_buckets = {
+    r: TokenBucket(REPORTER_RATE_PER_MIN, REPORTER_BURST) for r in [*REPORTER_TYPES, OTHER_REPORTER]
+}
+_global_bucket = TokenBucket(GLOBAL_RATE_PER_MIN, GLOBAL_BURST)
+_reserve_bucket = TokenBucket(GLOBAL_RESERVE_RATE_PER_MIN, GLOBAL_RESERVE_BURST)
+_gate = PriorityGate(MAX_IN_FLIGHT, MAX_QUEUE)
+_counters = {"admitted": 0, "rate_limited": 0, "reserve_admitted": 0, "shed": 0, "saturated": 0}
+
+
+def _is_trusted(ip: str) -> bool:
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(addr in net for net in TRUSTED_PROXIES)
+
+
+def _client_ip(request: Request) -> str:
+    """Connecting peer, or the right-most untrusted X-Forwarded-For hop when the peer is a trusted proxy."""
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or not _is_trusted(peer):
+        return peer
+    # Hops left of the first untrusted one are client-supplied and can be forged
+    for hop in reversed([h.strip() for h in forwarded.split(",") if h.strip()]):
+        if not _is_trusted(hop):
+            return hop
+    return peer
+
+
+def _ip_bucket(ip: str) -> TokenBucket:
+    bucket = _ip_buckets.get(ip)
+    if bucket is None:
+        bucket = _ip_buckets[ip] = TokenBucket(IP_RATE_PER_MIN, IP_BURST)
+        if len(_ip_buckets) > MAX_TRACKED_IPS:
+            _ip_buckets.popitem(last=False)
+    else:
+        _ip_buckets.move_to_end(ip)
+    return bucket
+
+
+def _rate_limit(request: Request, reporter_type: str, severity: int):
+    reporter_type = reporter_type or "Citoyen"
+    if reporter_type not in _reporter_buckets:
+        reporter_type = OTHER_REPORTER
+    global_bucket = _global_bucket
+    if severity >= HIGH_SEVERITY and _global_bucket.wait_time() > 0:
+        global_bucket = _reserve_bucket
+    buckets = [_ip_bucket(_client_ip(request)), _reporter_buckets[reporter_type], global_bucket]
+    # Check every bucket before taking from any, so a rejection costs nothing
+    wait = max(b.wait_time() for b in buckets)
+    if wait > 0:
+        _counters["rate_limited"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Trop de signalements, veuillez réessayer plus tard.",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+    for b in buckets:
+        b.take()
+    if global_bucket is _reserve_bucket:
+        _counters["reserve_admitted"] += 1
+
+
+@asynccontextmanager
+async def admit(request: Request, reporter_type: str, severity: int):
+    """Rate-limit, then hold an in-flight analysis slot for the duration of the block."""
+    _rate_limit(request, reporter_type, severity)
+    try:
+        await _gate.acquire(severity, MAX_WAIT_SECONDS)
+    except Saturated:
+        _counters["saturated"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Système saturé, veuillez réessayer plus tard.",
+            headers={"Retry-After": str(math.ceil(MAX_WAIT_SECONDS))},
+        )
+    _counters["admitted"] += 1
+    try:
+        yield
+    finally:
+        _gate.release()
+
+
+def stats() -> dict:
+    """Limiter and gate state for /metrics."""
+    return {
+        "in_flight": _gate.in_flight,
+        "max_in_flight": _gate.limit,
+        "queued_by_severity": _gate.queued_by_severity(),
+        "max_queue": _gate.max_queue,
+        "global_tokens": round(_global_bucket.tokens, 2),
+        "reserve_tokens": round(_reserve_bucket.tokens, 2),
+        "reporter_tokens": {k: round(b.tokens, 2) for k, b in _reporter_buckets.items()},
+        "tracked_ips": len(_ip_buckets),
+        **_counters,
+    }
@@ -0,0 +1,5 @@
+"""
+constants.py — Reference values shared by the API and the seed script.
+"""
+
+REPORTER_TYPES = ["Citoyen", "ONG", "Journaliste", "Employé municipal", "Médecin"]
@@ -9,6 +9,30 @@ ELASTIC_API_KEY = os.getenv("ELASTIC_API_KEY")
 
 INDEX_INCIDENTS = "incidents"
 INDEX_DECISIONS = "agent_decisions"
+INDEX_ROLLUPS = "incident_rollups_daily"
+
+FRENCH_ANALYSIS = {
+    "filter": {
+        "french_elision": {
+            "type": "elision",
+            "articles_case": True,
+            "articles": ["l", "m", "t", "qu", "n", "s", "j", "d", "c", "jusqu", "quoiqu", "lorsqu", "puisqu"],
+        },
+        "french_stemmer": {"type": "stemmer", "language": "light_french"},
+    },
+    "analyzer": {
+        # "l'hôpital", "hôpital" and "hopitaux" all meet at the same token
+        "french_folded": {
+            "tokenizer": "standard",
+            "filter": ["french_elision", "lowercase", "asciifolding", "french_stemmer"],
+        },
+        # No stemming for search-as-you-type: stems of partial words don't line up
+        "french_folded_prefix": {
+            "tokenizer": "standard",
+            "filter": ["french_elision", "lowercase", "asciifolding"],
+        },
+    },
+}
 
 es = Elasticsearch(
     ELASTIC_URL,
@@ -25,10 +49,17 @@ def create_indices():
     """Create indices if they don't exist."""
 
     incidents_mapping = {
+        "settings": {"analysis": FRENCH_ANALYSIS},
         "mappings": {
             "properties": {
                 "incident_id": {"type": "keyword"},
-                "description": {"type": "text"},
+                "description": {
+                    "type": "text",
+                    "analyzer": "french_folded",
+                    "fields": {
+                        "suggest": {"type": "search_as_you_type", "analyzer": "french_folded_prefix"},
+                    },
+                },
                 "service": {"type": "keyword"},
                 "category": {"type": "keyword"},
                 "severity": {"type": "integer"},
@@ -55,6 +86,32 @@ def create_indices():
                 "action_plan": {"type": "text"},
                 "similar_incidents_count": {"type": "integer"},
                 "created_at": {"type": "date"},
+                "service": {"type": "keyword"},
+                "region": {"type": "keyword"},
+                "category": {"type": "keyword"},
+            }
+        }
+    }
+
+    rollups_mapping = {
+        "mappings": {
+            "properties": {
+                "day": {"type": "date"},
+                "service": {"type": "keyword"},
+                "region": {"type": "keyword"},
+                "category": {"type": "keyword"},
+                "count": {"type": "integer"},
+                "severity_sum": {"type": "integer"},
+                "severity_mix": {"properties": {str(s): {"type": "integer"} for s in range(1, 6)}},
+                "decision_mix": {"properties": {
+                    d: {"type": "integer"}
+                    for d in ("CRITICAL_ESCALATION", "URGENT_ACTION", "STANDARD_PROCESSING", "MONITOR")
+                }},
+                "resolved_count": {"type": "integer"},
+                "resolution_hours_sum": {"type": "float"},
+                "sla_met": {"type": "integer"},
+                # Watermark document only (no `day`, so trend queries skip it)
+                "last_day": {"type": "date"},
             }
         }
     }
@@ -66,11 +123,19 @@ def create_indices():
     if not es.indices.exists(index=INDEX_DECISIONS):
         es.indices.create(index=INDEX_DECISIONS, body=decisions_mapping)
         print(f"Index '{INDEX_DECISIONS}' created.")
+    else:
+        # Denormalized grouping fields added after the index was first created
+        props = decisions_mapping["mappings"]["properties"]
+        es.indices.put_mapping(index=INDEX_DECISIONS, properties={k: props[k] for k in ("service", "region", "category")})
+
+    if not es.indices.exists(index=INDEX_ROLLUPS):
+        es.indices.create(index=INDEX_ROLLUPS, body=rollups_mapping)
+        print(f"Index '{INDEX_ROLLUPS}' created.")
 
 
 def index_incident(incident: dict) -> str:
-    """Index an incident into Elasticsearch."""
-    resp = es.index(index=INDEX_INCIDENTS, document=incident)
+    """Index an incident into Elasticsearch, keyed on its incident_id."""
+    resp = es.index(index=INDEX_INCIDENTS, id=incident["incident_id"], document=incident)
     return resp["_id"]
 
 
@@ -95,6 +160,65 @@ def get_similar_incidents(description: str, category: str, ville: str, size: int
     return [hit["_source"] for hit in resp["hits"]["hits"]]
 
 
+def search_incidents(q: str, filters: dict, size: int = 10) -> dict:
+    """Typeahead search over descriptions with highlighting and service/category/status facets.
+
+    Filters apply to hits through post_filter; each facet counts under every
+    filter except its own, so picking a service still lists the other services.
+    """
+    terms = {field: {"term": {field: value}} for field, value in filters.items() if value}
+    facet_sizes = {"service": 20, "category": 20, "status": 10}
+    query = {
+        "query": {
+            "multi_match": {
+                "query": q,
+                "type": "bool_prefix",
+                "fields": [
+                    "description",
+                    "description.suggest",
+                    "description.suggest._2gram",
+                    "description.suggest._3gram",
+                ],
+            }
+        },
+        "post_filter": {"bool": {"filter": list(terms.values())}},
+        "_source": ["incident_id", "description", "service", "category", "severity",
+                    "status", "ville", "region", "created_at"],
+        "highlight": {
+            # Descriptions are citizen-written: escape them around the <mark> tags
+            "encoder": "html",
+            "fields": {"description": {}, "description.suggest": {}},
+            "pre_tags": ["<mark>"],
+            "post_tags": ["</mark>"],
+        },
+        "aggs": {
+            name: {
+                "filter": {"bool": {"filter": [t for field, t in terms.items() if field != name]}},
+                "aggs": {"values": {"terms": {"field": name, "size": facet_size}}},
+            }
+            for name, facet_size in facet_sizes.items()
+        },
+        "size": size,
+    }
+    resp = es.search(index=INDEX_INCIDENTS, body=query)
+    results = []
+    for hit in resp["hits"]["hits"]:
+        highlight = hit.get("highlight", {})
+        results.append({
+            **hit["_source"],
+            "highlight": highlight.get("description") or highlight.get("description.suggest", []),
+        })
+    aggs = resp["aggregations"]
+    return {
+        "total": resp["hits"]["total"]["value"],
+        "results": results,
+        "facets": {
+            name: {b["key"]: b["doc_count"] for b in aggs[name]["values"]["buckets"]}
+            for name in facet_sizes
+        },
+    }
+
+
 def get_recent_incidents_by_service(service: str, size: int = 10) -> list:
     """Get recent incidents for a given service."""
     query = {
@@ -107,8 +231,8 @@ def get_recent_incidents_by_service(service: str, size: int = 10) -> list:
 
 
 def log_decision(decision: dict) -> str:
-    """Log agent decision into Elasticsearch."""
-    resp = es.index(index=INDEX_DECISIONS, document=decision)
+    """Log agent decision into Elasticsearch, keyed on its incident_id."""
+    resp = es.index(index=INDEX_DECISIONS, id=decision["incident_id"], document=decision)
     return resp["_id"]
 
 
@@ -0,0 +1,204 @@
+"""
+gazetteer.py — Offline gazetteer for Togo: canonical ville/region names and local geocoding.
+
+Place names from gazetteer.json are loaded at import into an accent-folded
+trie (prefix autocomplete + bounded-edit fuzzy matching) and a 2-d KD-tree
+(reverse geocoding), so ingest can canonicalize ville/region and fill in
+`location` without any network call.
+"""
+
+import os
+import json
+import math
+import unicodedata
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "gazetteer.json")
+
+_REGION_PREFIXES = ("region des ", "region de la ", "region du ", "region de ", "region ")
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation: 'Notsé' -> 'notse'."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    for ch in "-'’_.,":
+        text = text.replace(ch, " ")
+    return " ".join(text.split())
+
+
+class _Trie:
+    __slots__ = ("children", "values")
+
+    def __init__(self):
+        self.children = {}
+        self.values = []
+
+    def insert(self, key: str, value):
+        node = self
+        for ch in key:
+            node = node.children.setdefault(ch, _Trie())
+        if value not in node.values:
+            node.values.append(value)
+
+    def exact(self, key: str) -> list:
+        node = self
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return node.values
+
+    def complete(self, prefix: str) -> list:
+        node = self
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        found, stack = [], [node]
+        while stack:
+            n = stack.pop()
+            found.extend(n.values)
+            stack.extend(n.children.values())
+        return found
+
+    def fuzzy(self, key: str, max_edits: int) -> list:
+        """(edits, value) pairs within `max_edits` Levenshtein edits of `key`."""
+        found = []
+        first_row = list(range(len(key) + 1))
+        for ch, child in self.children.items():
+            child._fuzzy(ch, key, first_row, max_edits, found)
+        return found
+
+    def _fuzzy(self, ch: str, key: str, prev_row: list, max_edits: int, found: list):
+        row = [prev_row[0] + 1]
+        for i in range(1, len(key) + 1):
+            row.append(min(row[i - 1] + 1, prev_row[i] + 1, prev_row[i - 1] + (key[i - 1] != ch)))
+        if row[-1] <= max_edits:
+            found.extend((row[-1], v) for v in self.values)
+        # Prune branches that can no longer come back within the edit budget
+        if min(row) <= max_edits:
+            for next_ch, child in self.children.items():
+                child._fuzzy(next_ch, key, row, max_edits, found)
+
+
+def _edit_budget(key: str) -> int:
+    # Short names get few edits, or "Bè" would match every two-letter typo
+    return 0 if len(key) <= 3 else 1 if len(key) <= 5 else 2
+
+
+def _project(lat: float, lon: float) -> tuple:
+    # Equirectangular is accurate enough for nearest-neighbour at Togo's latitudes
+    return (lon * math.cos(math.radians(lat)), lat)
+
+
+def _build_kdtree(points: list, depth: int = 0):
+    if not points:
+        return None
+    axis = depth % 2
+    points.sort(key=lambda p: p[0][axis])
+    mid = len(points) // 2
+    return (points[mid], axis,
+            _build_kdtree(points[:mid], depth + 1),
+            _build_kdtree(points[mid + 1:], depth + 1))
+
+
+def _haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+class Gazetteer:
+    def __init__(self, path: str = GAZETTEER_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.places = []
+        self._names = _Trie()
+        self._regions = _Trie()
+        for region in data["regions"]:
+            self._regions.insert(fold(region), region)
+        for rank, p in enumerate(data["places"]):
+            place = {"ville": p["name"], "region": p["region"], "lat": p["lat"], "lon": p["lon"], "rank": rank}
+            self.places.append(place)
+            for name in [p["name"], *p.get("aliases", [])]:
+                self._names.insert(fold(name), rank)
+        self._kdtree = _build_kdtree([(_project(p["lat"], p["lon"]), p["rank"]) for p in self.places])
+
+    def _public(self, rank: int) -> dict:
+        p = self.places[rank]
+        return {"ville": p["ville"], "region": p["region"], "lat": p["lat"], "lon": p["lon"]}
+
+    def lookup(self, ville: str):
+        """Best place for a free-text ville: exact folded match, else fuzzy. None if unknown."""
+        key = fold(ville)
+        if not key:
+            return None
+        exact = self._names.exact(key)
+        if exact:
+            return self._public(min(exact))
+        matches = self._names.fuzzy(key, _edit_budget(key))
+        if not matches:
+            return None
+        return self._public(min(matches)[1])
+
+    def canonical_region(self, region: str):
+        key = fold(region)
+        for prefix in _REGION_PREFIXES:
+            if key.startswith(prefix):
+                key = key[len(prefix):]
+                break
+        exact = self._regions.exact(key)
+        if exact:
+            return exact[0]
+        matches = self._regions.fuzzy(key, _edit_budget(key))
+        return min(matches)[1] if matches else None
+
+    def resolve(self, ville: str, region: str) -> dict:
+        """Canonical ville/region (and location when known) for an incoming report.
+
+        Unknown villes are kept as typed; the region comes from the matched
+        place when there is one, since the town is the more specific signal.
+        """
+        place = self.lookup(ville)
+        if place:
+            return {"ville": place["ville"], "region": place["region"],
+                    "location": {"lat": place["lat"], "lon": place["lon"]}}
+        return {"ville": (ville or "").strip(), "region": self.canonical_region(region) or (region or "").strip(),
+                "location": None}
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> list:
+        key = fold(prefix)
+        if not key:
+            return []
+        ranks = sorted(set(self._names.complete(key)))
+        if not ranks:
+            ranks = [r for _, r in sorted(self._names.fuzzy(key, _edit_budget(key)))]
+            ranks = list(dict.fromkeys(ranks))
+        return [self._public(r) for r in ranks[:limit]]
+
+    def reverse(self, lat: float, lon: float) -> dict:
+        """Nearest known place to a coordinate, with its distance in km."""
+        target = _project(lat, lon)
+        best = [None, float("inf")]
+
+        def search(node):
+            if node is None:
+                return
+            (point, rank), axis, left, right = node
+            d = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2
+            if d < best[1]:
+                best[0], best[1] = rank, d
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            search(near)
+            if diff * diff < best[1]:
+                search(far)
+
+        search(self._kdtree)
+        place = self._public(best[0])
+        place["distance_km"] = round(_haversine_km(lat, lon, place["lat"], place["lon"]), 2)
+        return place
+
+
+gazetteer = Gazetteer()
@@ -0,0 +1,195 @@
+"""
+journal.py — Local write-ahead log for the intake path.
+
+When Elasticsearch is unreachable (or a backlog is already waiting), incidents,
+decisions and escalations are appended to a SQLite journal in WAL mode instead
+of being dropped. A background task replays the journal to Elasticsearch in
+order through bulk requests, using the incident_id as document id so that a
+replayed write can never create a duplicate.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import date
+from elasticsearch import helpers, ApiError, ConnectionError, ConnectionTimeout
+from dotenv import load_dotenv
+
+from elastic_client import es
+
+load_dotenv()
+
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", os.path.join(os.path.dirname(__file__), "sentinel_journal.db"))
+JOURNAL_MAX_ENTRIES = int(os.getenv("JOURNAL_MAX_ENTRIES", "50000"))
+JOURNAL_REPLAY_INTERVAL = float(os.getenv("JOURNAL_REPLAY_INTERVAL", "10"))
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "500"))
+
+
+class JournalFullError(Exception):
+    """Raised when the journal has reached JOURNAL_MAX_ENTRIES."""
+
+
+_lock = threading.Lock()
+_conn = sqlite3.connect(JOURNAL_PATH, check_same_thread=False, isolation_level=None)
+_conn.execute("PRAGMA journal_mode=WAL")
+_conn.execute("PRAGMA synchronous=FULL")
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS entries ("
+    " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " index_name TEXT NOT NULL,"
+    " doc_id TEXT NOT NULL,"
+    " body TEXT NOT NULL,"
+    " created_at REAL NOT NULL)"
+)
+_conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+# Entries ES rejected permanently (4xx other than 409/429), kept for inspection
+_conn.execute(
+    "CREATE TABLE IF NOT EXISTS dead_letters ("
+    " seq INTEGER PRIMARY KEY,"
+    " index_name TEXT NOT NULL,"
+    " doc_id TEXT NOT NULL,"
+    " body TEXT NOT NULL,"
+    " created_at REAL NOT NULL,"
+    " status INTEGER,"
+    " error TEXT,"
+    " failed_at REAL NOT NULL)"
+)
+
+_last_replay = {"at": None, "error": None, "replayed": 0}
+# UTC days (created_at) of documents replayed since the last take_replayed_days()
+_replayed_days = set()
+
+
+def is_transient(error: Exception) -> bool:
+    """True for failures worth journaling: transport errors, timeouts, 429 and 5xx."""
+    if isinstance(error, (ConnectionError, ConnectionTimeout)):
+        return True
+    if isinstance(error, ApiError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _is_permanent(status) -> bool:
+    return status is not None and 400 <= status < 500 and status not in (409, 429)
+
+
+def append(index_name: str, document: dict) -> int:
+    """Durably append a document destined for `index_name`. Returns its sequence number."""
+    with _lock:
+        depth = _conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if depth >= JOURNAL_MAX_ENTRIES:
+            raise JournalFullError(f"journal full ({depth} entries)")
+        cur = _conn.execute(
+            "INSERT INTO entries (index_name, doc_id, body, created_at) VALUES (?, ?, ?, ?)",
+            (index_name, document["incident_id"], json.dumps(document, ensure_ascii=False), time.time()),
+        )
+        return cur.lastrowid
+
+
+def pending() -> int:
+    """Number of entries waiting to be replayed."""
+    with _lock:
+        return _conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def _checkpoint() -> int:
+    row = _conn.execute("SELECT value FROM meta WHERE key = 'checkpoint'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def replay() -> int:
+    """Replay pending entries to Elasticsearch in order. Returns the number replayed.
+
+    Entries are sent as bulk `create` operations keyed on incident_id: a 409
+    conflict means the document already made it to ES and counts as replayed.
+    A permanent rejection (any other 4xx) moves the entry to dead_letters so
+    it can't block the entries behind it. The checkpoint only advances over a
+    contiguous run of handled entries, so a transient failure (429, 5xx,
+    connection) in the middle of a batch is retried from that entry next time.
+    """
+    with _lock:
+        rows = _conn.execute(
+            "SELECT seq, index_name, doc_id, body FROM entries ORDER BY seq LIMIT ?",
+            (JOURNAL_BATCH_SIZE,),
+        ).fetchall()
+    if not rows:
+        return 0
+
+    actions = [
+        {"_op_type": "create", "_index": index_name, "_id": doc_id, "_source": json.loads(body)}
+        for _, index_name, doc_id, body in rows
+    ]
+    last_ok = None
+    dead = []
+    days = set()
+    try:
+        results = helpers.streaming_bulk(es, actions, raise_on_error=False, max_retries=0)
+        for (seq, _, _, _), action, (ok, item) in zip(rows, actions, results):
+            status = item.get("create", {}).get("status")
+            if not ok and _is_permanent(status):
+                dead.append((seq, status, str(item.get("create", {}).get("error"))))
+            elif not ok and status != 409:
+                _last_replay["error"] = str(item.get("create", {}).get("error"))
+                break
+            elif action["_source"].get("created_at"):
+                days.add(date.fromisoformat(action["_source"]["created_at"][:10]))
+            last_ok = seq
+        else:
+            _last_replay["error"] = None
+    except Exception as e:
+        _last_replay["error"] = f"{type(e).__name__}: {e}"
+
+    replayed = 0
+    if last_ok is not None:
+        with _lock:
+            _conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            for seq, status, error in dead:
+                _conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters "
+                    "SELECT seq, index_name, doc_id, body, created_at, ?, ?, ? FROM entries WHERE seq = ?",
+                    (status, error, now, seq),
+                )
+                print(f"⚠️ Journal entry {seq} rejected by ES ({status}), moved to dead letters: {error}")
+            replayed = _conn.execute("DELETE FROM entries WHERE seq <= ?", (last_ok,)).rowcount - len(dead)
+            _conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('checkpoint', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (str(last_ok),),
+            )
+            _conn.execute("COMMIT")
+            _replayed_days.update(days)
+    _last_replay["at"] = time.time()
+    _last_replay["replayed"] += replayed
+    return replayed
+
+
+def take_replayed_days() -> set:
+    """Days of documents replayed since the last call, so their rollups can be recomputed."""
+    with _lock:
+        days = set(_replayed_days)
+        _replayed_days.clear()
+    return days
+
+
+def stats() -> dict:
+    """Journal depth, size and replay lag for /health."""
+    with _lock:
+        depth, oldest = _conn.execute("SELECT COUNT(*), MIN(created_at) FROM entries").fetchone()
+        checkpoint = _checkpoint()
+        dead_letters = _conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+    size_bytes = sum(
+        os.path.getsize(p) for p in (JOURNAL_PATH, JOURNAL_PATH + "-wal") if os.path.exists(p)
+    )
+    return {
+        "backlog_depth": depth,
+        "max_entries": JOURNAL_MAX_ENTRIES,
+        "size_bytes": size_bytes,
+        "replay_lag_seconds": round(time.time() - oldest, 1) if oldest else 0,
+        "checkpoint": checkpoint,
+        "replayed_total": _last_replay["replayed"],
+        "dead_letters": dead_letters,
+        "last_replay_error": _last_replay["error"],
+    }
@@ -1,18 +1,26 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime, timezone
+import asyncio
 import uuid
+from elasticsearch import ApiError
 
 from report_client import generate_weekly_report
 from whatsapp_client import send_critical_alert
 from elastic_client import (
     check_connection, create_indices, index_incident,
     get_similar_incidents, log_decision, get_all_incidents,
-    get_stats, es, INDEX_INCIDENTS, INDEX_DECISIONS
+    get_stats, search_incidents, es, INDEX_INCIDENTS, INDEX_DECISIONS
 )
 from agent_client import analyze_incident
+import journal
+from surge_detector import detector
+import response_cache
+import admission
+from gazetteer import gazetteer
+import rollups
 
 app = FastAPI(title="AfriGov Sentinel API", version="2.0.0")
 
@@ -31,36 +39,82 @@ class IncidentReport(BaseModel):
     ville: str
     region: str
     reporter_type: Optional[str] = "Citoyen"
-    lat: Optional[float] = None
-    lon: Optional[float] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
 
 class StatusUpdate(BaseModel):
     status: str
     note: Optional[str] = ""
 
+_indices_ready = False
+
+def _ensure_indices():
+    global _indices_ready
+    create_indices()
+    # Create escalations index
+    if not es.indices.exists(index="escalations"):
+        es.indices.create(index="escalations", body={
+            "mappings": {"properties": {
+                "incident_id": {"type": "keyword"},
+                "decision": {"type": "keyword"},
+                "risk_score": {"type": "float"},
+                "service": {"type": "keyword"},
+                "region": {"type": "keyword"},
+                "ville": {"type": "keyword"},
+                "description": {"type": "text"},
+                "created_at": {"type": "date"},
+                "resolved": {"type": "boolean"},
+                "resolved_at": {"type": "date"},
+            }}
+        })
+    _indices_ready = True
+
 @app.on_event("startup")
 async def startup_event():
+    asyncio.create_task(_journal_replay_loop())
+    asyncio.create_task(_rollup_loop())
     try:
-        create_indices()
-        # Create escalations index
-        if not es.indices.exists(index="escalations"):
-            es.indices.create(index="escalations", body={
-                "mappings": {"properties": {
-                    "incident_id": {"type": "keyword"},
-                    "decision": {"type": "keyword"},
-                    "risk_score": {"type": "float"},
-                    "service": {"type": "keyword"},
-                    "region": {"type": "keyword"},
-                    "ville": {"type": "keyword"},
-                    "description": {"type": "text"},
-                    "created_at": {"type": "date"},
-                    "resolved": {"type": "boolean"},
-                    "resolved_at": {"type": "date"},
-                }}
-            })
+        _ensure_indices()
         print("✅ Elasticsearch connected and indices ready.")
     except Exception as e:
         print(f"⚠️ Startup error: {e}")
+    try:
+        await asyncio.to_thread(detector.bootstrap)
+        print("✅ Surge baselines bootstrapped from history.")
+    except Exception as e:
+        print(f"⚠️ Surge bootstrap error: {e}")
+
+async def _journal_replay_loop():
+    """Drain the local journal into Elasticsearch once the cluster is reachable."""
+    while True:
+        await asyncio.sleep(journal.JOURNAL_REPLAY_INTERVAL)
+        if not journal.pending():
+            continue
+        try:
+            # Never replay into auto-created indices with dynamic mappings
+            if not _indices_ready:
+                await asyncio.to_thread(_ensure_indices)
+            replayed = await asyncio.to_thread(journal.replay)
+            # Late writes land in days the rollup job has already summarized
+            rollups.mark_dirty(journal.take_replayed_days())
+            if replayed:
+                response_cache.bump()
+                print(f"✅ Replayed {replayed} journaled documents to Elasticsearch.")
+        except Exception as e:
+            print(f"⚠️ Journal replay error: {e}")
+
+async def _rollup_loop():
+    """Refresh the daily rollups behind /analytics/trends."""
+    while True:
+        try:
+            if not _indices_ready:
+                await asyncio.to_thread(_ensure_indices)
+            written = await asyncio.to_thread(rollups.run)
+            response_cache.bump()
+            print(f"✅ Rollups refreshed ({written} documents).")
+        except Exception as e:
+            print(f"⚠️ Rollup error: {e}")
+        await asyncio.sleep(rollups.ROLLUP_INTERVAL_MINUTES * 60)
 
 @app.get("/")
 def root():
@@ -70,13 +124,22 @@ def root():
 def health():
     try:
         info = check_connection()
-        return {"status": "healthy", "elasticsearch": info["version"]["number"]}
+        return {"status": "healthy", "elasticsearch": info["version"]["number"], "journal": journal.stats()}
     except Exception as e:
-        raise HTTPException(status_code=503, detail=str(e))
+        raise HTTPException(status_code=503, detail={"error": str(e), "journal": journal.stats()})
+
+@app.get("/metrics")
+def metrics():
+    return {"admission": admission.stats(), "journal": journal.stats()}
 
 @app.post("/report-incident")
-async def report_incident(report: IncidentReport):
+async def report_incident(report: IncidentReport, request: Request):
+    async with admission.admit(request, report.reporter_type, report.severity):
+        return await _process_incident(report)
+
+async def _process_incident(report: IncidentReport):
     incident_id = f"INC-{uuid.uuid4().hex[:8].upper()}"
+    place = gazetteer.resolve(report.ville, report.region)
     incident = {
         "incident_id": incident_id,
         "description": report.description,
@@ -85,8 +148,8 @@ async def report_incident(report: IncidentReport):
         "severity": report.severity,
         "status": "En cours",
         "created_at": datetime.now(timezone.utc).isoformat(),
-        "ville": report.ville,
-        "region": report.region,
+        "ville": place["ville"],
+        "region": place["region"],
         "reporter_type": report.reporter_type,
         "priority": _compute_priority(report.severity),
         "sla_hours": _compute_sla(report.severity),
@@ -94,15 +157,26 @@ async def report_incident(report: IncidentReport):
     }
     if report.lat and report.lon:
         incident["location"] = {"lat": report.lat, "lon": report.lon}
+    elif place["location"]:
+        incident["location"] = place["location"]
 
     try:
-        es_id = index_incident(incident)
-        incident["_es_id"] = es_id
+        es_id = _persist(INDEX_INCIDENTS, incident, index_incident)
+    except journal.JournalFullError as e:
+        raise HTTPException(status_code=503, detail=f"ES unavailable and {e}")
+    except ApiError as e:
+        if 400 <= e.status_code < 500:
+            raise HTTPException(status_code=400, detail=f"Incident rejected by ES: {e}")
+        raise HTTPException(status_code=500, detail=f"ES error: {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ES error: {e}")
+    if es_id:
+        incident["_es_id"] = es_id
+    response_cache.bump()
+    detector.observe(incident)
 
     try:
-        similar = get_similar_incidents(report.description, report.category, report.ville)
+        similar = get_similar_incidents(report.description, report.category, incident["ville"])
     except Exception:
         similar = []
 
@@ -117,28 +191,32 @@ async def report_incident(report: IncidentReport):
         "contact": analysis.get("contact", {}),
         "similar_incidents_count": len(similar),
         "created_at": datetime.now(timezone.utc).isoformat(),
+        "service": incident["service"],
+        "region": incident["region"],
+        "category": incident["category"],
     }
     try:
-        log_decision(decision_doc)
+        _persist(INDEX_DECISIONS, decision_doc, log_decision)
     except Exception as e:
         print(f"⚠️ Could not log decision: {e}")
 
     # Auto-escalate critical incidents
     if analysis["decision"] == "CRITICAL_ESCALATION":
         try:
-            es.index(index="escalations", document={
+            _persist("escalations", {
                 "incident_id": incident_id,
                 "decision": analysis["decision"],
                 "risk_score": analysis["risk_score"],
                 "service": report.service,
-                "region": report.region,
-                "ville": report.ville,
+                "region": incident["region"],
+                "ville": incident["ville"],
                 "description": report.description,
                 "created_at": datetime.now(timezone.utc).isoformat(),
                 "resolved": False,
-            })
+            }, _index_escalation)
         except Exception as e:
             print(f"⚠️ Could not log escalation: {e}")
+    response_cache.bump()
 
     # WhatsApp alert for critical incidents
     if analysis["decision"] == "CRITICAL_ESCALATION":
@@ -150,6 +228,7 @@ async def report_incident(report: IncidentReport):
     return {
         "incident_id": incident_id,
         "status": "Analysé",
+        "queued": es_id is None,
         "analysis": {
             "risk_score": analysis["risk_score"],
             "decision": analysis["decision"],
@@ -163,32 +242,66 @@ async def report_incident(report: IncidentReport):
     }
 
 @app.get("/incidents")
-def list_incidents(size: int = 100):
-    try:
+def list_incidents(request: Request, size: int = 100):
+    def build():
         incidents = get_all_incidents(size=size)
         return {"total": len(incidents), "incidents": incidents}
+    try:
+        return response_cache.cached_response(request, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stats")
-def stats():
+def stats(request: Request):
     try:
-        return get_stats()
+        return response_cache.cached_response(request, get_stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/escalations")
-def get_escalations():
-    try:
+def get_escalations(request: Request):
+    def build():
         resp = es.search(index="escalations", body={
             "query": {"term": {"resolved": False}},
             "sort": [{"created_at": {"order": "desc"}}],
             "size": 50,
         })
         return {"total": len(resp["hits"]["hits"]), "escalations": [h["_source"] for h in resp["hits"]["hits"]]}
+    try:
+        return response_cache.cached_response(request, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/search")
+def search(request: Request, q: str, service: Optional[str] = None, category: Optional[str] = None,
+           status: Optional[str] = None, size: int = Query(10, ge=1, le=50)):
+    # Hot prefixes get their own short-TTL cache, which writes don't clear
+    def build():
+        return search_incidents(q, {"service": service, "category": category, "status": status}, size=size)
+    try:
+        return response_cache.search_cache.cached_response(request, build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/geo/autocomplete")
+def geo_autocomplete(q: str, limit: int = 10):
+    results = gazetteer.autocomplete(q, limit=limit)
+    return {"total": len(results), "results": results}
+
+@app.get("/geo/reverse")
+def geo_reverse(lat: float, lon: float):
+    return gazetteer.reverse(lat, lon)
+
+@app.get("/alerts/surges")
+def surge_alerts(limit: int = 50):
+    surges = detector.surges(limit=limit)
+    return {
+        "total": len(surges),
+        "bucket_minutes": detector.bucket_seconds // 60,
+        "threshold_sigma": detector.threshold,
+        "surges": surges,
+    }
+
 @app.patch("/incidents/{incident_id}/status")
 def update_status(incident_id: str, update: StatusUpdate):
     try:
@@ -202,6 +315,7 @@ def update_status(incident_id: str, update: StatusUpdate):
             esc = es.search(index="escalations", body={"query": {"term": {"incident_id": incident_id}}})
             for h in esc["hits"]["hits"]:
                 es.update(index="escalations", id=h["_id"], body={"doc": {"resolved": True, "resolved_at": datetime.now(timezone.utc).isoformat()}})
+        response_cache.bump()
         return {"success": True, "incident_id": incident_id, "new_status": update.status}
     except HTTPException:
         raise
@@ -209,8 +323,8 @@ def update_status(incident_id: str, update: StatusUpdate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/dashboard/summary")
-def dashboard_summary():
-    try:
+def dashboard_summary(request: Request):
+    def build():
         stats_data = get_stats()
         # Unresolved critical incidents
         critical = es.search(index=INDEX_INCIDENTS, body={
@@ -224,6 +338,20 @@ def dashboard_summary():
             "unresolved_critical": critical["hits"]["total"]["value"],
             "pending_escalations": esc["hits"]["total"]["value"],
         }
+    try:
+        return response_cache.cached_response(request, build)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analytics/trends")
+def analytics_trends(request: Request, interval: str = "week", days: int = 90, service: Optional[str] = None,
+                     region: Optional[str] = None, category: Optional[str] = None):
+    if interval not in rollups.INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(rollups.INTERVALS)}")
+    def build():
+        return rollups.get_trends(interval, days, {"service": service, "region": region, "category": category})
+    try:
+        return response_cache.cached_response(request, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -248,6 +376,26 @@ async def generate_report():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _persist(index_name: str, document: dict, write):
+    """Write to ES directly, or to the local journal if ES fails or a backlog is pending.
+
+    Returns the ES document id, or None when the document was journaled.
+    """
+    # Keep ES writes in order: nothing jumps ahead of journaled documents
+    if not journal.pending():
+        try:
+            return write(document)
+        except Exception as e:
+            # A permanent rejection would only block the journal behind it
+            if not journal.is_transient(e):
+                raise
+            print(f"⚠️ ES write to '{index_name}' failed, journaling: {e}")
+    journal.append(index_name, document)
+    return None
+
+def _index_escalation(escalation: dict) -> str:
+    return es.index(index="escalations", id=escalation["incident_id"], document=escalation)["_id"]
+
 def _compute_priority(severity: int) -> str:
     return {1: "P5", 2: "P4", 3: "P3", 4: "P2", 5: "P1"}.get(severity, "P5")
 
@@ -0,0 +1,139 @@
+"""
+response_cache.py — Cached, pre-serialized responses for the read-heavy dashboard and search endpoints.
+
+Entries are keyed on the request path + query string. Dashboard entries are
+tagged with a data version that moves on every write (bump()); while it is
+unchanged and the entry is younger than its TTL, the cached body is served
+as-is and a matching If-None-Match gets a 304 without touching Elasticsearch. Search has its own LRU that writes don't
+clear: hot prefixes expire on a short TTL instead. Bodies are serialized once
+with orjson and compressed per client (brotli or gzip) on first demand.
+"""
+
+import os
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import brotli
+import orjson
+from fastapi import Request, Response
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backstop for writes this process can't see (other workers, seed_data.py, Kibana)
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_MAX_ENTRIES = 256
+# Typeahead results may lag new reports by this much
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "10"))
+SEARCH_CACHE_MAX_ENTRIES = 1024
+MIN_COMPRESS_BYTES = 1024
+
+
+def _negotiate(accept_encoding: str) -> str:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in accepted:
+            return encoding
+    return "identity"
+
+
+def _encode(entry: dict, encoding: str) -> bytes:
+    body = entry["identity"]
+    if encoding not in entry:
+        entry[encoding] = brotli.compress(body, quality=5) if encoding == "br" else gzip.compress(body, 6)
+    return entry[encoding]
+
+
+def _representation(entry: dict, accept_encoding: str) -> tuple:
+    """(content-coding, strong ETag) of the variant this client gets."""
+    encoding = _negotiate(accept_encoding)
+    if len(entry["identity"]) < MIN_COMPRESS_BYTES:
+        encoding = "identity"
+    # Strong ETags must differ per content-coding
+    etag = entry["etag"] if encoding == "identity" else f'{entry["etag"][:-1]}-{encoding}"'
+    return encoding, etag
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+
+
+class ResponseCache:
+    """LRU of serialized responses.
+
+    Within the TTL and until the next bump(), a revalidation is answered 304
+    without calling `build()`. Past the TTL the entry is rebuilt first, and a
+    304 is only sent if the fresh body still hashes to the client's ETag.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = 0
+
+    def bump(self):
+        """Mark all cached responses stale. Call after every write."""
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def cached_response(self, request: Request, build) -> Response:
+        """Serve `build()` from the cache, honouring If-None-Match and Accept-Encoding."""
+        key = (request.url.path, str(request.query_params))
+        accept_encoding = request.headers.get("accept-encoding", "")
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            # Past the TTL the entry may hide writes we can't see: rebuild before
+            # trusting its ETag, even for a revalidation
+            if entry and now - entry["built_at"] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry:
+                self._entries.move_to_end(key)
+            version = self._version
+
+        if entry is not None:
+            encoding, headers["ETag"] = _representation(entry, accept_encoding)
+            if _not_modified(request, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+        else:
+            body = orjson.dumps(build(), option=orjson.OPT_NON_STR_KEYS)
+            entry = {
+                "identity": body,
+                "etag": f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+                "built_at": now,
+            }
+            with self._lock:
+                # Don't cache a body built while a write landed: it may already be stale
+                if version == self._version:
+                    self._entries[key] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            encoding, headers["ETag"] = _representation(entry, accept_encoding)
+            if _not_modified(request, headers["ETag"]):
+                return Response(status_code=304, headers=headers)
+
+        if encoding == "identity":
+            return Response(content=entry["identity"], media_type="application/json", headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(content=_encode(entry, encoding), media_type="application/json", headers=headers)
+
+
+_dashboard_cache = ResponseCache(CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES)
+bump = _dashboard_cache.bump
+cached_response = _dashboard_cache.cached_response
+
+search_cache = ResponseCache(SEARCH_CACHE_TTL_SECONDS, SEARCH_CACHE_MAX_ENTRIES)
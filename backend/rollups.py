@@ -0,0 +1,220 @@
+"""
+rollups.py — Daily rollups and the ES|QL trend queries behind /analytics/trends.
+
+A scheduled job summarizes each day into one document per (service, region,
+category) in INDEX_ROLLUPS: incident count, severity mix, agent decision mix,
+and resolution time / SLA compliance of escalations resolved that day. Trend
+queries then read a few hundred rollup documents instead of raw incidents.
+"""
+
+import os
+import threading
+from datetime import datetime, date, time, timedelta, timezone
+from elasticsearch import helpers, NotFoundError
+from dotenv import load_dotenv
+
+from elastic_client import es, INDEX_INCIDENTS, INDEX_DECISIONS, INDEX_ROLLUPS
+
+load_dotenv()
+
+ROLLUP_INTERVAL_MINUTES = int(os.getenv("ROLLUP_INTERVAL_MINUTES", "60"))
+ROLLUP_BACKFILL_DAYS = int(os.getenv("ROLLUP_BACKFILL_DAYS", "90"))
+# Id of the document in INDEX_ROLLUPS recording the last day rolled up
+WATERMARK_ID = "_watermark"
+
+SEVERITIES = ("1", "2", "3", "4", "5")
+DECISIONS = ("CRITICAL_ESCALATION", "URGENT_ACTION", "STANDARD_PROCESSING", "MONITOR")
+INTERVALS = {"day": "1 day", "week": "1 week", "month": "1 month"}
+
+_TREND_STATS = ", ".join(
+    ["count = SUM(count)", "severity_sum = SUM(severity_sum)", "resolved = SUM(resolved_count)",
+     "resolution_hours = SUM(resolution_hours_sum)", "sla_met = SUM(sla_met)"]
+    + [f"sev_{s} = SUM(`severity_mix.{s}`)" for s in SEVERITIES]
+    + [f"{d} = SUM(`decision_mix.{d}`)" for d in DECISIONS]
+)
+
+
+_dirty_days = set()
+_dirty_lock = threading.Lock()
+
+
+def mark_dirty(days):
+    """Queue past days for recomputation on the next run (e.g. after journal replay)."""
+    with _dirty_lock:
+        _dirty_days.update(days)
+
+
+def _esql_datetime(dt: datetime) -> str:
+    # The format TO_DATETIME parses by default
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _esql(query: str, params: list) -> list:
+    resp = es.esql.query(query=query, params=params)
+    names = [c["name"] for c in resp["columns"]]
+    return [dict(zip(names, row)) for row in resp["values"]]
+
+
+def rollup_day(day: date) -> int:
+    """Recompute the rollup documents for one UTC day. Returns the number written."""
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    bounds = [_esql_datetime(start), _esql_datetime(start + timedelta(days=1))]
+    docs = {}
+
+    def doc_for(service, region, category):
+        key = (service, region, category)
+        if key not in docs:
+            docs[key] = {
+                "day": day.isoformat(), "service": service, "region": region, "category": category,
+                "count": 0, "severity_sum": 0,
+                "severity_mix": {s: 0 for s in SEVERITIES},
+                "decision_mix": {d: 0 for d in DECISIONS},
+                "resolved_count": 0, "resolution_hours_sum": 0.0, "sla_met": 0,
+            }
+        return docs[key]
+
+    evals = ", ".join(f"s{s} = CASE(severity == {s}, 1, 0)" for s in SEVERITIES)
+    sums = ", ".join(f"s{s} = SUM(s{s})" for s in SEVERITIES)
+    for row in _esql(f"""FROM {INDEX_INCIDENTS}
+| WHERE created_at >= TO_DATETIME(?) AND created_at < TO_DATETIME(?)
+| EVAL {evals}
+| STATS count = COUNT(*), severity_sum = SUM(severity), {sums} BY service, region, category
+| LIMIT 10000""", bounds):
+        doc = doc_for(row["service"], row["region"], row["category"])
+        doc["count"] = row["count"]
+        doc["severity_sum"] = row["severity_sum"] or 0
+        doc["severity_mix"] = {s: row[f"s{s}"] or 0 for s in SEVERITIES}
+
+    # Decisions logged before service/region/category were denormalized have no group
+    for row in _esql(f"""FROM {INDEX_DECISIONS}
+| WHERE created_at >= TO_DATETIME(?) AND created_at < TO_DATETIME(?) AND service IS NOT NULL
+| STATS n = COUNT(*) BY service, region, category, decision
+| LIMIT 10000""", bounds):
+        if row["decision"] in DECISIONS:
+            doc_for(row["service"], row["region"], row["category"])["decision_mix"][row["decision"]] = row["n"]
+
+    resolved = es.search(index="escalations", body={
+        "query": {"range": {"resolved_at": {"gte": bounds[0], "lt": bounds[1]}}},
+        "_source": ["incident_id", "created_at", "resolved_at"],
+        "size": 10000,
+    })["hits"]["hits"]
+    if resolved:
+        # Escalations carry no category or SLA: take both from the incident
+        incidents = es.search(index=INDEX_INCIDENTS, body={
+            "query": {"terms": {"incident_id": [h["_source"]["incident_id"] for h in resolved]}},
+            "_source": ["incident_id", "service", "region", "category", "sla_hours"],
+            "size": len(resolved),
+        })["hits"]["hits"]
+        by_id = {h["_source"]["incident_id"]: h["_source"] for h in incidents}
+        for h in resolved:
+            esc = h["_source"]
+            inc = by_id.get(esc["incident_id"])
+            if not inc:
+                continue
+            hours = (datetime.fromisoformat(esc["resolved_at"])
+                     - datetime.fromisoformat(esc["created_at"])).total_seconds() / 3600
+            doc = doc_for(inc["service"], inc["region"], inc["category"])
+            doc["resolved_count"] += 1
+            doc["resolution_hours_sum"] += hours
+            doc["sla_met"] += int(hours <= inc.get("sla_hours", 72))
+
+    actions = [
+        {"_index": INDEX_ROLLUPS, "_id": f"{day.isoformat()}|{'|'.join(str(k) for k in key)}", "_source": doc}
+        for key, doc in docs.items()
+    ]
+    helpers.bulk(es, actions)
+    return len(actions)
+
+
+def _watermark():
+    try:
+        return date.fromisoformat(es.get(index=INDEX_ROLLUPS, id=WATERMARK_ID)["_source"]["last_day"])
+    except NotFoundError:
+        return None
+
+
+def run() -> int:
+    """Roll up every day from the watermark through today, plus days marked dirty.
+
+    The watermark day itself is recomputed since it was still open when last
+    rolled up, so no day is skipped however long the job was down. Without a
+    watermark, ROLLUP_BACKFILL_DAYS are backfilled.
+    """
+    today = datetime.now(timezone.utc).date()
+    start = _watermark() or today - timedelta(days=ROLLUP_BACKFILL_DAYS - 1)
+    with _dirty_lock:
+        dirty = set(_dirty_days)
+        _dirty_days.clear()
+    days = {start + timedelta(days=n) for n in range((today - start).days + 1)}
+    days |= {d for d in dirty if d <= today}
+    written = 0
+    try:
+        for day in sorted(days):
+            written += rollup_day(day)
+    except Exception:
+        mark_dirty(dirty)
+        raise
+    es.index(index=INDEX_ROLLUPS, id=WATERMARK_ID, document={"last_day": today.isoformat()})
+    return written
+
+
+def _summarize(row: dict) -> dict:
+    count = row["count"] or 0
+    resolved = row["resolved"] or 0
+    return {
+        "count": count,
+        "avg_severity": round((row["severity_sum"] or 0) / count, 2) if count else 0,
+        "severity_mix": {s: row[f"sev_{s}"] or 0 for s in SEVERITIES},
+        "decision_mix": {d: row[d] or 0 for d in DECISIONS},
+        "resolved": resolved,
+        "mttr_hours": round(row["resolution_hours"] / resolved, 1) if resolved else None,
+        "sla_compliance": round(row["sla_met"] / resolved, 3) if resolved else None,
+    }
+
+
+def _period_start(day: date, interval: str) -> date:
+    """Start of the period containing `day`, matching ES|QL DATE_TRUNC (ISO weeks start Monday)."""
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+def get_trends(interval: str, days: int, filters: dict) -> dict:
+    """Per-period series with period-over-period change, plus a per-service breakdown.
+
+    The window starts on a period boundary so the first point is complete.
+    The current period is still open: it is flagged `partial` and gets no
+    change_pct, since comparing part of a period with a full one is meaningless.
+    """
+    today = datetime.now(timezone.utc).date()
+    current = _period_start(today, interval)
+    since = datetime.combine(_period_start(today - timedelta(days=days), interval), time.min, tzinfo=timezone.utc)
+    where, params = ["day >= TO_DATETIME(?)"], [_esql_datetime(since)]
+    for field, value in filters.items():
+        if value:
+            where.append(f"{field} == ?")
+            params.append(value)
+    source = f"FROM {INDEX_ROLLUPS}\n| WHERE {' AND '.join(where)}"
+
+    series = []
+    for row in _esql(f"""{source}
+| EVAL period = DATE_TRUNC({INTERVALS[interval]}, day)
+| STATS {_TREND_STATS} BY period
+| SORT period
+| LIMIT 1000""", params):
+        partial = date.fromisoformat(row["period"][:10]) >= current
+        point = {"period": row["period"], "partial": partial, **_summarize(row)}
+        prev = series[-1]["count"] if series else None
+        point["change_pct"] = round(100 * (point["count"] - prev) / prev, 1) if prev and not partial else None
+        series.append(point)
+
+    by_service = [
+        {"service": row["service"], **_summarize(row)}
+        for row in _esql(f"""{source}
+| STATS {_TREND_STATS} BY service
+| SORT count DESC
+| LIMIT 100""", params)
+    ]
+    return {"interval": interval, "since": since.date().isoformat(), "series": series, "by_service": by_service}
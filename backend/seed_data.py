@@ -8,6 +8,8 @@ import os
 sys.path.insert(0, os.path.dirname(__file__))
 
 from elastic_client import create_indices, index_incident, es, INDEX_INCIDENTS
+from gazetteer import gazetteer
+from constants import REPORTER_TYPES
 from datetime import datetime, timedelta, timezone
 import random
 
@@ -44,24 +46,6 @@ INCIDENTS = [
     {"description": "Cimetière municipal sans entretien depuis plusieurs mois", "service": "Administration Municipale", "category": "Qualité médiocre", "severity": 1, "ville": "Tsévié", "region": "Maritime"},
 ]
 
-LOCS = {
-    "Lomé": (6.1375, 1.2123),
-    "Aného": (6.2267, 1.5950),
-    "Tsévié": (6.4253, 1.2164),
-    "Sokodé": (8.9833, 1.1333),
-    "Kara": (9.5511, 1.1864),
-    "Kpalimé": (6.8978, 0.6406),
-    "Atakpamé": (7.5333, 1.1333),
-    "Dapaong": (10.8667, 0.2000),
-    "Tabligbo": (6.5833, 1.5000),
-    "Notse": (6.9500, 1.1667),
-    "Bafilo": (9.3500, 1.2500),
-    "Notsé": (6.9500, 1.1667),
-}
-
-REPORTER_TYPES = ["Citoyen", "ONG", "Journaliste", "Employé municipal", "Médecin"]
-
-
 def seed():
     print("Creating indices...")
     create_indices()
@@ -80,7 +64,8 @@ def seed():
     now = datetime.now(timezone.utc)
 
     for i, inc in enumerate(INCIDENTS):
-        loc = LOCS.get(inc["ville"], (6.1375, 1.2123))
+        place = gazetteer.resolve(inc["ville"], inc["region"])
+        loc = place["location"] or {"lat": 6.1375, "lon": 1.2123}
         jitter_lat = random.uniform(-0.05, 0.05)
         jitter_lon = random.uniform(-0.05, 0.05)
 
@@ -95,9 +80,9 @@ def seed():
             "severity": inc["severity"],
             "status": random.choice(["En cours", "Résolu", "Escaladé", "En attente"]),
             "created_at": (now - timedelta(days=random.randint(0, 90))).isoformat(),
-            "ville": inc["ville"],
-            "region": inc["region"],
-            "location": {"lat": loc[0] + jitter_lat, "lon": loc[1] + jitter_lon},
+            "ville": place["ville"],
+            "region": place["region"],
+            "location": {"lat": loc["lat"] + jitter_lat, "lon": loc["lon"] + jitter_lon},
             "reporter_type": random.choice(REPORTER_TYPES),
             "priority": priority_map[inc["severity"]],
             "sla_hours": sla_map[inc["severity"]],
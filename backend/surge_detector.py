@@ -0,0 +1,187 @@
+"""
+surge_detector.py — Streaming surge detection per region / ville / service / category.
+
+Every incident on the ingest path is counted into a count-min sketch for the
+current time bucket. When a bucket closes, each sketch cell is folded into an
+EWMA mean and variance kept in a second grid of the same shape, so memory
+stays constant no matter how many (region, ville, service, category) keys
+appear. A key surges when its count in the current bucket exceeds its
+baseline by more than SURGE_THRESHOLD_SIGMA standard deviations.
+"""
+
+import os
+import math
+import threading
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from dotenv import load_dotenv
+
+from elastic_client import es, INDEX_INCIDENTS
+
+load_dotenv()
+
+SURGE_BUCKET_MINUTES = int(os.getenv("SURGE_BUCKET_MINUTES", "60"))
+SURGE_THRESHOLD_SIGMA = float(os.getenv("SURGE_THRESHOLD_SIGMA", "3.0"))
+SURGE_ALPHA = float(os.getenv("SURGE_ALPHA", "0.05"))
+SURGE_MIN_COUNT = int(os.getenv("SURGE_MIN_COUNT", "3"))
+SURGE_HISTORY_DAYS = int(os.getenv("SURGE_HISTORY_DAYS", "30"))
+
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+MAX_EVENTS = 500
+BOOTSTRAP_PAGE_SIZE = 1000
+
+# Granularities tracked for every incident, from coarse to fine
+KEY_FIELDS = [
+    ("region", "service"),
+    ("region", "service", "category"),
+    ("region", "ville", "service"),
+    ("region", "ville", "service", "category"),
+]
+
+
+class SurgeDetector:
+    def __init__(self, bucket_minutes: int = SURGE_BUCKET_MINUTES, alpha: float = SURGE_ALPHA,
+                 threshold: float = SURGE_THRESHOLD_SIGMA, min_count: int = SURGE_MIN_COUNT):
+        self.bucket_seconds = bucket_minutes * 60
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_count = min_count
+        cells = SKETCH_WIDTH * SKETCH_DEPTH
+        self._counts = [0] * cells
+        self._mean = [0.0] * cells
+        self._var = [0.0] * cells
+        self._bucket = None
+        self._active = {}
+        self.events = deque(maxlen=MAX_EVENTS)
+        self._lock = threading.Lock()
+
+    def _cells(self, key: tuple) -> list:
+        return [row * SKETCH_WIDTH + hash((row, key)) % SKETCH_WIDTH for row in range(SKETCH_DEPTH)]
+
+    def _bucket_of(self, ts: datetime) -> int:
+        return int(ts.timestamp()) // self.bucket_seconds
+
+    def _fold(self):
+        """Close the current bucket: fold every cell's count into its EWMA baseline."""
+        a = self.alpha
+        counts, mean, var = self._counts, self._mean, self._var
+        for i in range(len(counts)):
+            diff = counts[i] - mean[i]
+            incr = a * diff
+            mean[i] += incr
+            var[i] = (1 - a) * (var[i] + diff * incr)
+            counts[i] = 0
+        self._active = {}
+
+    def _decay(self, k: int):
+        """Fold `k` empty buckets at once.
+
+        Folding a zero count gives mean' = (1-a)*mean and
+        var' = (1-a)*(var + a*mean**2); over k steps that is
+        mean_k = d*mean and var_k = d*var + d*(1-d)*mean**2 with d = (1-a)**k.
+        """
+        d = (1 - self.alpha) ** k
+        spread = d * (1 - d)
+        mean, var = self._mean, self._var
+        for i in range(len(mean)):
+            m = mean[i]
+            var[i] = d * var[i] + spread * m * m
+            mean[i] = d * m
+
+    def _advance(self, bucket: int):
+        if self._bucket is None:
+            self._bucket = bucket
+            return
+        if bucket <= self._bucket:
+            return
+        self._fold()
+        if bucket - self._bucket > 1:
+            self._decay(bucket - self._bucket - 1)
+        self._bucket = bucket
+
+    def _add(self, key: tuple, n: int = 1) -> tuple:
+        """Add `n` to `key` in the current bucket; returns (observed, baseline mean, baseline std)."""
+        cells = self._cells(key)
+        for c in cells:
+            self._counts[c] += n
+        observed = min(self._counts[c] for c in cells)
+        mean = min(self._mean[c] for c in cells)
+        var = min(self._var[c] for c in cells)
+        return observed, mean, math.sqrt(var)
+
+    def observe(self, incident: dict, ts: datetime = None):
+        """Count an incident from the ingest path and raise surge events for keys over threshold."""
+        ts = ts or datetime.now(timezone.utc)
+        with self._lock:
+            self._advance(self._bucket_of(ts))
+            for fields in KEY_FIELDS:
+                key = tuple(incident.get(f, "") for f in fields)
+                observed, mean, std = self._add((fields, key))
+                # Poisson floor so sparse keys with near-zero variance don't fire on every report
+                std = max(std, math.sqrt(mean), 1.0)
+                deviations = (observed - mean) / std
+                if observed < self.min_count or deviations < self.threshold:
+                    continue
+                event = self._active.get((fields, key))
+                if event is None:
+                    event = {
+                        **dict(zip(fields, key)),
+                        "bucket_start": datetime.fromtimestamp(
+                            self._bucket * self.bucket_seconds, timezone.utc).isoformat(),
+                        "detected_at": ts.isoformat(),
+                    }
+                    self._active[(fields, key)] = event
+                    self.events.appendleft(event)
+                event.update({
+                    "observed": observed,
+                    "baseline": round(mean, 2),
+                    "deviations": round(deviations, 2),
+                })
+
+    def bootstrap(self, days: int = SURGE_HISTORY_DAYS):
+        """Warm baselines from history with one composite aggregation, paged in time order.
+
+        The date_histogram source comes first, so pages arrive bucket by
+        bucket and each page stays well under search.max_buckets however
+        many keys there are.
+        """
+        now = datetime.now(timezone.utc)
+        fields = KEY_FIELDS[-1]
+        composite = {
+            "size": BOOTSTRAP_PAGE_SIZE,
+            "sources": [
+                {"bucket": {"date_histogram": {"field": "created_at", "fixed_interval": f"{self.bucket_seconds}s"}}},
+                *({f: {"terms": {"field": f}}} for f in fields),
+            ],
+        }
+        # Page through ES before taking the lock so live observe() calls never wait on it
+        history = []
+        while True:
+            resp = es.search(index=INDEX_INCIDENTS, body={
+                "size": 0,
+                "query": {"range": {"created_at": {"gte": (now - timedelta(days=days)).isoformat()}}},
+                "aggs": {"history": {"composite": composite}},
+            })
+            agg = resp["aggregations"]["history"]
+            history.extend(agg["buckets"])
+            if "after_key" not in agg or len(agg["buckets"]) < BOOTSTRAP_PAGE_SIZE:
+                break
+            composite["after"] = agg["after_key"]
+
+        with self._lock:
+            for b in history:
+                self._advance(int(b["key"]["bucket"] // 1000) // self.bucket_seconds)
+                for key_fields in KEY_FIELDS:
+                    self._add((key_fields, tuple(b["key"][f] for f in key_fields)), b["doc_count"])
+            self._advance(self._bucket_of(now))
+            # History seeds baselines only; it must not surface as live alerts
+            self.events.clear()
+            self._active = {}
+
+    def surges(self, limit: int = 50) -> list:
+        with self._lock:
+            return list(self.events)[:limit]
+
+
+detector = SurgeDetector()